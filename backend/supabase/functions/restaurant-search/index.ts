@@ -43,6 +43,20 @@ interface GooglePlace {
   business_status?: string;
 }
 
+const PHOTO_URL_PREFIX = 'https://maps.googleapis.com/maps/api/place/photo?maxwidth=400&photoreference=';
+
+// In-memory cache of Nearby Search responses. It lives as long as the function
+// instance, so warm invocations skip the Google round-trip for repeat searches.
+// Cached responses include opening_hours.open_now, so is_open in a response can be
+// up to the TTL old; keep the TTL short.
+const NEARBY_SEARCH_CACHE_TTL_MS = 5 * 60 * 1000; // 5 minutes
+const NEARBY_SEARCH_CACHE_MAX_ENTRIES = 500;
+const nearbySearchCache = new Map<string, { data: GooglePlacesResponse; expiresAt: number }>();
+
+// Nearby Search requests currently in flight, so concurrent identical searches
+// share one Google request instead of each making their own
+const inflightNearbySearches = new Map<string, Promise<GooglePlacesResponse | null>>();
+
 serve(async (req) => {
   // Handle CORS preflight requests
   if (req.method === 'OPTIONS') {
@@ -84,6 +98,20 @@ serve(async (req) => {
       });
     }
 
+    // Validate price levels (Google accepts integers 0-4)
+    if (body.priceLevel !== undefined && (
+      !Array.isArray(body.priceLevel) ||
+      !body.priceLevel.every(level => Number.isInteger(level) && level >= 0 && level <= 4)
+    )) {
+      return new Response(JSON.stringify({
+        success: false,
+        error: 'Invalid priceLevel. Must be an array of integers between 0 and 4.'
+      }), {
+        status: 400,
+        headers: { ...corsHeaders, 'Content-Type': 'application/json' }
+      });
+    }
+
     // Get Google Places API key from environment variables
     const googleApiKey = Deno.env.get('GOOGLE_PLACES_API_KEY');
     
@@ -102,38 +130,52 @@ serve(async (req) => {
     const radius = body.radius || 16093; // 10 miles in meters
     const type = body.type || 'restaurant';
     
-    let googleUrl = `https://maps.googleapis.com/maps/api/place/nearbysearch/json?` +
-      `location=${body.latitude},${body.longitude}&` +
-      `radius=${radius}&` +
-      `type=${type}&` +
-      `key=${googleApiKey}`;
-
-    // Add optional parameters
-    if (body.minRating) {
-      googleUrl += `&minprice=${Math.floor(body.minRating)}`;
+    const params = new URLSearchParams({
+      location: `${body.latitude},${body.longitude}`,
+      radius: String(radius),
+      type,
+      key: googleApiKey
+    });
+
+    // Add optional parameters. Google filters price server-side as a min/max range;
+    // Nearby Search has no rating filter, so minRating is applied to the results below.
+    if (body.priceLevel && body.priceLevel.length > 0) {
+      params.set('minprice', String(Math.min(...body.priceLevel)));
+      params.set('maxprice', String(Math.max(...body.priceLevel)));
     }
 
     if (body.keyword) {
-      googleUrl += `&keyword=${encodeURIComponent(body.keyword)}`;
+      params.set('keyword', body.keyword);
     }
 
-    console.log('Fetching from Google Places API for location:', body.latitude, body.longitude);
+    const googleUrl = `https://maps.googleapis.com/maps/api/place/nearbysearch/json?${params}`;
 
-    // Call Google Places API
-    const googleResponse = await fetch(googleUrl);
-    
-    if (!googleResponse.ok) {
-      console.error('Google Places API HTTP error:', googleResponse.status);
-      return new Response(JSON.stringify({
-        success: false,
-        error: 'API not working - Google Places service unavailable'
-      }), {
-        status: 500,
-        headers: { ...corsHeaders, 'Content-Type': 'application/json' }
-      });
-    }
+    // Reuse recent results for (roughly) the same search when available
+    const cacheKey = nearbySearchCacheKey(body.latitude, body.longitude, params);
+    const cachedData = getCachedNearbySearch(cacheKey);
+    let googleData: GooglePlacesResponse;
+
+    if (cachedData) {
+      console.log('Using cached Google Places results for location:', body.latitude, body.longitude);
+      googleData = cachedData;
+    } else {
+      console.log('Fetching from Google Places API for location:', body.latitude, body.longitude);
 
-    const googleData: GooglePlacesResponse = await googleResponse.json();
+      // Call Google Places API
+      const fetchedData = await fetchNearbySearch(googleUrl, cacheKey);
+
+      if (!fetchedData) {
+        return new Response(JSON.stringify({
+          success: false,
+          error: 'API not working - Google Places service unavailable'
+        }), {
+          status: 500,
+          headers: { ...corsHeaders, 'Content-Type': 'application/json' }
+        });
+      }
+
+      googleData = fetchedData;
+    }
 
     // API Key verification and error handling
     if (googleData.status === 'REQUEST_DENIED') {
@@ -179,14 +221,22 @@ serve(async (req) => {
     }
 
     // Transform Google Places data to our format
-    const restaurants = googleData.results
-      .filter(place => place.business_status !== 'CLOSED_PERMANENTLY')
-      .map(place => {
-        // Calculate distance
-        const distance = calculateDistance(
-          body.latitude, body.longitude,
-          place.geometry.location.lat, place.geometry.location.lng
-        );
+    const minRating = body.minRating || 0;
+    const places = googleData.results
+      .filter(place =>
+        place.business_status !== 'CLOSED_PERMANENTLY' &&
+        (place.rating ?? 0) >= minRating &&
+        (!body.priceLevel?.length || place.price_level === undefined || body.priceLevel.includes(place.price_level))
+      );
+
+    // Calculate distances for all places in one pass
+    const distances = calculateDistances(body.latitude, body.longitude, places);
+
+    const photoUrlSuffix = `&key=${googleApiKey}`;
+
+    const restaurants = places
+      .map((place, index) => {
+        const distance = distances[index];
 
         // Extract cuisine types from Google types
         const cuisineTypes = extractCuisineTypes(place.types);
@@ -202,8 +252,8 @@ serve(async (req) => {
           price_level: place.price_level,
           cuisine_types: cuisineTypes,
           distance_miles: Math.round(distance * 100) / 100,
-          photos: place.photos?.map(photo => 
-            `https://maps.googleapis.com/maps/api/place/photo?maxwidth=400&photoreference=${photo.photo_reference}&key=${googleApiKey}`
+          photos: place.photos?.map(photo =>
+            PHOTO_URL_PREFIX + photo.photo_reference + photoUrlSuffix
           ) || [],
           is_open: place.opening_hours?.open_now
         };
@@ -222,7 +272,7 @@ serve(async (req) => {
       timestamp: new Date().toISOString()
     };
 
-    console.log(`✅ Successfully found ${restaurants.length} restaurants`);
+    console.log('✅ Successfully found', restaurants.length, 'restaurants');
     return new Response(JSON.stringify(response), {
       status: 200,
       headers: { ...corsHeaders, 'Content-Type': 'application/json' }
@@ -240,50 +290,159 @@ serve(async (req) => {
   }
 });
 
-// Helper function to calculate distance between two points
-function calculateDistance(lat1: number, lon1: number, lat2: number, lon2: number): number {
-  const R = 3959; // Earth's radius in miles
-  const dLat = toRadians(lat2 - lat1);
-  const dLon = toRadians(lon2 - lon1);
-  const a = Math.sin(dLat / 2) * Math.sin(dLat / 2) +
-    Math.cos(toRadians(lat1)) * Math.cos(toRadians(lat2)) *
-    Math.sin(dLon / 2) * Math.sin(dLon / 2);
-  const c = 2 * Math.atan2(Math.sqrt(a), Math.sqrt(1 - a));
-  return R * c;
+// Helper function to build a cache key for a Nearby Search. Coordinates are rounded
+// to 3 decimals (~100 m) so nearby requests share an entry; the API key is left out.
+function nearbySearchCacheKey(lat: number, lng: number, params: URLSearchParams): string {
+  const keyParams = new URLSearchParams(params);
+  keyParams.set('location', `${lat.toFixed(3)},${lng.toFixed(3)}`);
+  keyParams.delete('key');
+  return keyParams.toString();
 }
 
-function toRadians(degrees: number): number {
-  return degrees * (Math.PI / 180);
+function getCachedNearbySearch(key: string): GooglePlacesResponse | undefined {
+  const entry = nearbySearchCache.get(key);
+  if (!entry) {
+    return undefined;
+  }
+  if (entry.expiresAt <= Date.now()) {
+    nearbySearchCache.delete(key);
+    return undefined;
+  }
+  return entry.data;
+}
+
+function setCachedNearbySearch(key: string, data: GooglePlacesResponse): void {
+  // Evict the oldest entry (Map keeps insertion order) once the cache is full,
+  // unless this write replaces an existing entry
+  if (!nearbySearchCache.has(key) && nearbySearchCache.size >= NEARBY_SEARCH_CACHE_MAX_ENTRIES) {
+    const oldestKey = nearbySearchCache.keys().next().value;
+    if (oldestKey !== undefined) {
+      nearbySearchCache.delete(oldestKey);
+    }
+  }
+  nearbySearchCache.set(key, { data, expiresAt: Date.now() + NEARBY_SEARCH_CACHE_TTL_MS });
+}
+
+// Helper function to run a Nearby Search, coalescing concurrent requests for the same
+// cache key. Successful responses are cached once here, not by each waiting caller.
+// Resolves to null when Google responds with an HTTP error.
+function fetchNearbySearch(url: string, cacheKey: string): Promise<GooglePlacesResponse | null> {
+  const inflight = inflightNearbySearches.get(cacheKey);
+  if (inflight) {
+    return inflight;
+  }
+
+  const request = fetchNearbySearchWithRetry(url)
+    .then(googleData => {
+      if (googleData && (googleData.status === 'OK' || googleData.status === 'ZERO_RESULTS')) {
+        setCachedNearbySearch(cacheKey, googleData);
+      }
+      return googleData;
+    })
+    .finally(() => inflightNearbySearches.delete(cacheKey));
+
+  inflightNearbySearches.set(cacheKey, request);
+  return request;
+}
+
+// Helper function to call Nearby Search with exponential backoff and jitter on transient
+// failures: network errors and timeouts, 429 and 5xx responses, and UNKNOWN_ERROR
+// statuses (which Google reports with HTTP 200). Each attempt has its own deadline.
+async function fetchNearbySearchWithRetry(
+  url: string,
+  maxAttempts = 3,
+  baseDelayMs = 250,
+  attemptTimeoutMs = 8000
+): Promise<GooglePlacesResponse | null> {
+  for (let attempt = 1; ; attempt++) {
+    const isLastAttempt = attempt >= maxAttempts;
+
+    try {
+      const googleResponse = await fetch(url, { signal: AbortSignal.timeout(attemptTimeoutMs) });
+
+      if (googleResponse.status === 429 || googleResponse.status >= 500) {
+        // Release the connection before retrying or giving up
+        await googleResponse.body?.cancel();
+        if (isLastAttempt) {
+          console.error('Google Places API HTTP error:', googleResponse.status);
+          return null;
+        }
+        console.warn('Google Places API transient error, retrying:', googleResponse.status, 'attempt', attempt);
+      } else if (!googleResponse.ok) {
+        console.error('Google Places API HTTP error:', googleResponse.status);
+        await googleResponse.body?.cancel();
+        return null;
+      } else {
+        const googleData: GooglePlacesResponse = await googleResponse.json();
+        if (googleData.status !== 'UNKNOWN_ERROR' || isLastAttempt) {
+          return googleData;
+        }
+        console.warn('Google Places API returned UNKNOWN_ERROR, retrying:', 'attempt', attempt);
+      }
+    } catch (error) {
+      if (isLastAttempt) {
+        throw error;
+      }
+      console.warn('Google Places API request failed, retrying:', error, 'attempt', attempt);
+    }
+
+    const delay = baseDelayMs * 2 ** (attempt - 1);
+    await new Promise(resolve => setTimeout(resolve, delay + Math.random() * delay));
+  }
+}
+
+const DEG_TO_RAD = Math.PI / 180;
+
+// Helper function to calculate distances from one point to many places.
+// The origin's trig terms are computed once and shared across all places.
+function calculateDistances(lat: number, lon: number, places: GooglePlace[]): Float64Array {
+  const R = 3959; // Earth's radius in miles
+  const lat1 = lat * DEG_TO_RAD;
+  const lon1 = lon * DEG_TO_RAD;
+  const cosLat1 = Math.cos(lat1);
+  const distances = new Float64Array(places.length);
+
+  for (let i = 0; i < places.length; i++) {
+    const { lat: placeLat, lng: placeLng } = places[i].geometry.location;
+    const lat2 = placeLat * DEG_TO_RAD;
+    const sinDLat = Math.sin((lat2 - lat1) / 2);
+    const sinDLon = Math.sin((placeLng * DEG_TO_RAD - lon1) / 2);
+    const a = sinDLat * sinDLat + cosLat1 * Math.cos(lat2) * sinDLon * sinDLon;
+    distances[i] = 2 * R * Math.atan2(Math.sqrt(a), Math.sqrt(1 - a));
+  }
+
+  return distances;
 }
 
+// Google Place types that map to a display cuisine
+const CUISINE_MAP: Record<string, string> = {
+  'bakery': 'Bakery',
+  'bar': 'Bar',
+  'cafe': 'Cafe',
+  'meal_delivery': 'Delivery',
+  'meal_takeaway': 'Takeaway',
+  'restaurant': 'Restaurant',
+  'food': 'Food',
+  'pizza_restaurant': 'Pizza',
+  'chinese_restaurant': 'Chinese',
+  'italian_restaurant': 'Italian',
+  'japanese_restaurant': 'Japanese',
+  'mexican_restaurant': 'Mexican',
+  'indian_restaurant': 'Indian',
+  'thai_restaurant': 'Thai',
+  'american_restaurant': 'American',
+  'seafood_restaurant': 'Seafood',
+  'steakhouse': 'Steakhouse',
+  'sushi_restaurant': 'Sushi',
+  'fast_food_restaurant': 'Fast Food',
+  'hamburger_restaurant': 'Burgers',
+  'sandwich_shop': 'Sandwiches'
+};
+
 // Helper function to extract cuisine types from Google Place types
 function extractCuisineTypes(types: string[]): string[] {
-  const cuisineMap: Record<string, string> = {
-    'bakery': 'Bakery',
-    'bar': 'Bar',
-    'cafe': 'Cafe',
-    'meal_delivery': 'Delivery',
-    'meal_takeaway': 'Takeaway',
-    'restaurant': 'Restaurant',
-    'food': 'Food',
-    'pizza_restaurant': 'Pizza',
-    'chinese_restaurant': 'Chinese',
-    'italian_restaurant': 'Italian',
-    'japanese_restaurant': 'Japanese',
-    'mexican_restaurant': 'Mexican',
-    'indian_restaurant': 'Indian',
-    'thai_restaurant': 'Thai',
-    'american_restaurant': 'American',
-    'seafood_restaurant': 'Seafood',
-    'steakhouse': 'Steakhouse',
-    'sushi_restaurant': 'Sushi',
-    'fast_food_restaurant': 'Fast Food',
-    'hamburger_restaurant': 'Burgers',
-    'sandwich_shop': 'Sandwiches'
-  };
-
   const cuisines = types
-    .map(type => cuisineMap[type])
+    .map(type => CUISINE_MAP[type])
     .filter(cuisine => cuisine !== undefined);
 
   // If no specific cuisine types found, default to 'Restaurant'